@@ -22,6 +22,11 @@ class ModelSchema:
         self.average_stream_length = 0.0
         self.routing_method = routing_method
         self.losses = {}
+        self.node_layers = []
+        self.stream_layer = gpd.GeoDataFrame()
+        self.links = pd.DataFrame()
+        self.subarea_assignments = pd.Series(dtype=object)
+        self.snap_issues = pd.DataFrame()
 
     def import_streams(self, gis_file, header='ID'):
         print('\nReading junction delineation file: {}'.format(gis_file))
@@ -39,7 +44,9 @@ class ModelSchema:
         # print(geo_df)
         self.add_nodes(geo_df)
 
-    def import_subarea_gis(self, subareas, subnodes, join_header='ID'):
+    def import_subarea_gis(self, subareas, subnodes, join_header='ID', spatial_join=False, tolerance=1000.0):
+        # spatial_join assigns each subarea polygon a subarea node by location instead of matching indexes,
+        # with polygons holding no node taking the nearest free node within the tolerance (in map units)
         print('\nReading subarea delineation file: {}'.format(subareas))
         geo_df = gpd.read_file(subareas)
         geo_df = geo_df.set_index(join_header)
@@ -50,11 +57,58 @@ class ModelSchema:
         node_df = gpd.read_file(subnodes)
         node_df = node_df.set_index(join_header)
         node_df = node_df.sort_index()
-        node_df['Area'] = np.around(geo_df.area / 1000000, 3)
+        if spatial_join:
+            self.assign_subareas(geo_df, node_df, tolerance)
+            areas = geo_df.area.groupby(self.subarea_assignments).sum()
+            # nodes left without a subarea keep an unknown area rather than a false zero
+            node_df['Area'] = np.around(areas.reindex(node_df.index) / 1000000, 3)
+        else:
+            node_df['Area'] = np.around(geo_df.area / 1000000, 3)
         # print(node_df)
         self.add_nodes(node_df)
 
+    def assign_subareas(self, geo_df, node_df, tolerance=1000.0):
+        # bulk point-in-polygon query of the subarea nodes against the subarea polygons
+        print('\nAssigning subareas to nodes by location (snap tolerance: {})...'.format(tolerance))
+        subarea_nodes = node_df[node_df['Type'] == 'subarea']
+        subarea_idx, node_idx = subarea_nodes.sindex.query(geo_df.geometry, predicate='contains')
+        pairs = pd.DataFrame({'subarea': geo_df.index[subarea_idx], 'node': subarea_nodes.index[node_idx]})
+        per_subarea = pairs.groupby('subarea')['node'].transform('size')
+        per_node = pairs.groupby('node')['subarea'].transform('size')
+        assignments = pairs[(per_subarea == 1) & (per_node == 1)]
+
+        # polygons holding no node take the nearest free node, which usually sits just over their boundary
+        free_nodes = subarea_nodes[~subarea_nodes.index.isin(assignments['node'])]
+        empty = geo_df[~geo_df.index.isin(pairs['subarea'])]
+        (empty_idx, free_idx), distances = free_nodes.sindex.nearest(empty.geometry, max_distance=tolerance,
+                                                                     return_all=True, return_distance=True)
+        snapped = pd.DataFrame({'subarea': empty.index[empty_idx], 'node': free_nodes.index[free_idx],
+                                'distance': distances, 'node_position': free_idx})
+        snapped = snapped.sort_values(['distance', 'node_position']).drop_duplicates('node')
+        snapped = snapped.drop_duplicates('subarea')
+        assignments = pd.concat([assignments, snapped[['subarea', 'node']]])
+
+        # polygons sharing their nodes take the one still free that is nearest their centre
+        crowded = pairs[~pairs['subarea'].isin(assignments['subarea']) &
+                        ~pairs['node'].isin(assignments['node'])].copy()
+        centres = geo_df.representative_point()
+        crowded['distance'] = centres.loc[crowded['subarea']].distance(
+            subarea_nodes.geometry.loc[crowded['node']], align=False).to_numpy()
+        crowded['node_position'] = subarea_nodes.index.get_indexer(crowded['node'])
+        crowded = crowded.sort_values(['distance', 'node_position']).drop_duplicates('node')
+        crowded = crowded.drop_duplicates('subarea')
+        assignments = pd.concat([assignments, crowded[['subarea', 'node']]])
+        self.subarea_assignments = assignments.set_index('subarea')['node'].sort_index()
+
+        # report polygons and nodes left without a match, and nodes lying inside several polygons
+        assigned = self.subarea_assignments.index.value_counts().reindex(geo_df.index, fill_value=0)
+        self.report_snap_issues('subarea', assigned, node_type='subarea')
+        contained = pairs.groupby('node').size().reindex(subarea_nodes.index, fill_value=0)
+        assigned = self.subarea_assignments.value_counts().reindex(subarea_nodes.index, fill_value=0)
+        self.report_snap_issues('subarea node', assigned.where(contained <= 1, contained), node_type='subarea')
+
     def add_streams(self, geo_df):
+        self.stream_layer = geo_df
         total_length = 0.0
         num_streams = 0
         for stream_id, stream_data in geo_df.iterrows():
@@ -72,6 +126,9 @@ class ModelSchema:
         print('The average stream length is {} km'.format(self.average_stream_length))
 
     def add_nodes(self, geo_df):
+        # keep the node numbers the reach attributes refer to, whichever ID the layer is indexed by
+        node_numbers = geo_df['Node_Num'] if 'Node_Num' in geo_df.columns else geo_df.index.to_series()
+        self.node_layers.append(geo_df[['Type', 'geometry']].assign(Node_Num=node_numbers))
         for node_id, node in geo_df.iterrows():
             if node['Type'] == 'subarea':
                 new_node = AreaNode(name=node_id)
@@ -86,9 +143,86 @@ class ModelSchema:
 
             elif node['Type'] == 'junction':
                 new_node = StorageNode(name=[node_id])
+                new_node.position = node['geometry']
                 print('Found junction: {}'.format(node_id))
                 self.nodes['junction'].append(new_node)
 
+    def connect_streams(self, tolerance=1.0):
+        # snap the reach end points to the nodes within the tolerance (in map units) using a spatial index.
+        # Reaches are assumed to be digitised in the direction of flow: the first vertex is the upstream end.
+        print('\nConnecting streams to nodes (snap tolerance: {})...'.format(tolerance))
+        if self.stream_layer.empty:
+            raise ValueError('No streams to connect, import the streams before connecting them')
+        if not self.node_layers:
+            raise ValueError('No nodes to connect to, import the subarea or junction nodes before the streams')
+        node_df = pd.concat(self.node_layers)
+        coordinates = self.stream_layer.geometry.get_coordinates()
+        ends = {'upstream': coordinates.groupby(level=0).first(),
+                'downstream': coordinates.groupby(level=0).last()}
+        links = pd.DataFrame(index=self.stream_layer.index)
+        for end, xy in ends.items():
+            points = gpd.GeoSeries(gpd.points_from_xy(xy['x'], xy['y']), index=xy.index, crs=node_df.crs)
+            stream_idx, node_idx = node_df.sindex.query(points, predicate='dwithin', distance=tolerance)
+            pairs = pd.DataFrame({'stream': points.index[stream_idx],
+                                  'node_position': node_idx,
+                                  'distance': points.iloc[stream_idx].distance(node_df.geometry.iloc[node_idx],
+                                                                               align=False).to_numpy()})
+            candidates = pairs.groupby('stream').size().reindex(links.index, fill_value=0)
+            nearest = pairs.sort_values(['distance', 'node_position']).drop_duplicates('stream').set_index('stream')
+            nearest_nodes = node_df.iloc[nearest['node_position']]
+            links[end + '_node'] = pd.Series(nearest_nodes.index, index=nearest.index)
+            links[end + '_type'] = pd.Series(nearest_nodes['Type'].to_numpy(), index=nearest.index)
+            links[end + '_number'] = pd.Series(nearest_nodes['Node_Num'].to_numpy(), index=nearest.index)
+            links[end + '_distance'] = nearest['distance']
+            self.report_snap_issues('{} end of stream'.format(end), candidates, node_type=links[end + '_type'])
+        self.links = links
+
+        # check the snapped nodes against the node numbers in the reach attributes where they exist,
+        # which also catches reaches digitised against the direction of flow
+        attributes = {'upstream': 'USNodeNum', 'downstream': 'DSNodeNum'}
+        if all(column in self.stream_layer.columns for column in attributes.values()):
+            for end, column in attributes.items():
+                snapped = links.dropna(subset=[end + '_number'])
+                numbers = snapped[end + '_number'].astype(self.stream_layer[column].dtype)
+                expected = self.stream_layer.loc[snapped.index, column]
+                mismatched = numbers != expected
+                self.record_snap_issues('{} end of stream'.format(end), snapped.loc[mismatched, end + '_type'],
+                                        'snapped to node ' + numbers[mismatched].astype(str) +
+                                        ' but {} is '.format(column) + expected[mismatched].astype(str))
+        else:
+            # without them, each node drains through a single reach, so a node at the upstream end of
+            # several reaches points to reaches digitised against the direction of flow
+            upstream_ends = links.groupby(['upstream_node', 'upstream_type']).size()
+            upstream_ends = upstream_ends[upstream_ends > 1].reset_index(level='upstream_type')
+            self.record_snap_issues('node', upstream_ends['upstream_type'],
+                                    'the upstream end of ' + upstream_ends[0].astype(str) + ' streams')
+
+        # hand the connections to the model elements
+        nodes = {}
+        for node in self.nodes['subarea'] + self.nodes['junction']:
+            name = node.name[0] if isinstance(node.name, list) else node.name
+            nodes[(name, node.type)] = node
+        for stream in self.streams:
+            link = links.loc[stream.name]
+            stream.upstream_node = nodes.get((link['upstream_node'], link['upstream_type']))
+            stream.downstream_node = nodes.get((link['downstream_node'], link['downstream_type']))
+        print('Connected {} of {} streams at both ends'.format(len(links.dropna()), len(links)))
+
+    def report_snap_issues(self, feature, candidates, node_type=''):
+        # orphans found no match, ambiguous snaps found more than one and took the preferred match
+        issues = pd.DataFrame({'node_type': node_type, 'candidates': candidates})
+        issues = issues[issues['candidates'] != 1].copy()
+        issues['issue'] = np.where(issues['candidates'] == 0, 'orphan', 'ambiguous')
+        issues['issue'] += ' (' + issues['candidates'].astype(str) + ' candidates)'
+        self.record_snap_issues(feature, issues['node_type'], issues['issue'])
+
+    def record_snap_issues(self, feature, node_types, issues):
+        issues = pd.DataFrame({'feature': feature, 'node_type': node_types, 'issue': issues})
+        for feature_id, row in issues.iterrows():
+            print('Warning: {} {} is {}'.format(row['feature'], feature_id, row['issue']))
+        self.snap_issues = pd.concat([self.snap_issues, issues])
+        self.snap_issues.index.name = 'ID'
+
     def add_rainfall(self, rainfall_dict):
         print('Applying rainfall to subareas...')
         for subarea in self.nodes['subarea']:
@@ -125,6 +125,36 @@ class StorageNode:
         # Store the results
         self.computation_df = pd.DataFrame(computation).set_index('Time')
 
+    def compute_peak_outflow(self, peak_to_beat=0.0, volume_to_beat=0.0):
+        # route the inflows keeping only the peak and volume of the outflows, stopping as soon as the rest of the
+        # inflows can no longer lift the outflow above peak_to_beat or its volume above volume_to_beat
+        times = self.inflows.index.to_numpy()
+        inflows = self.inflows.iloc[:, 0].to_numpy()
+        delta_times = np.diff(times) * 3600  # in seconds
+        average_inflows = 0.5 * (inflows[1:] + inflows[:-1])
+
+        # bounds on what is still to come from each timestep: outflow only rises while the inflow exceeds it,
+        # and the routing can release no more water than is in storage plus what is still to flow in
+        remaining_peak = np.maximum.accumulate(inflows[::-1])[::-1]
+        remaining_volume = np.append(np.cumsum((delta_times * average_inflows)[::-1])[::-1], 0.0)
+
+        initial_storage = 0.0
+        initial_outflow = 0.0
+        result = {'Peak': 0.0, 'Time_of_peak': times[0], 'Volume': 0.0, 'Completed': True}
+        for step in range(len(delta_times)):
+            if max(result['Peak'], remaining_peak[step]) <= peak_to_beat and \
+                    result['Volume'] + initial_storage + remaining_volume[step] <= volume_to_beat:
+                result['Completed'] = False
+                break
+            outflow = self.route_flow(delta_times[step], average_inflows[step], initial_outflow, initial_storage)
+            result['Volume'] += delta_times[step] * 0.5 * (initial_outflow + outflow)
+            if outflow > result['Peak']:
+                result['Peak'] = outflow
+                result['Time_of_peak'] = times[step + 1]
+            initial_storage = self.storage_from_routing(outflow)
+            initial_outflow = outflow
+        return result
+
     def route_flow(self, delta_time, average_inflow, initial_outflow, initial_storage):
         delta_storage = delta_time * (average_inflow - initial_outflow)
         storage = delta_storage + initial_storage
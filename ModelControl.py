@@ -12,16 +12,19 @@ model = ModelSchema(name='Burdekin', routing_method='rorb')
 
 model.import_subarea_gis(subnodes='gis/Burdekin_v2_SubNodes.shp',
                          subareas='gis/Burdekin_v2_upperlower_Subarea_Centroid.shp',
-                         join_header='SubA_Num')
+                         join_header='SubA_Num',
+                         spatial_join=True,
+                         tolerance=5000.0)
 
-# Junctions might be obsolete - check class objects for obsolete code
-# model.import_junction_gis(gis_file='gis/Burdekin_v2_junctions.shp',
-#                           header='Node_Num')
+# Junctions are needed for the reach end points to snap to
+model.import_junction_gis(gis_file='gis/Burdekin_v2_junctions.shp',
+                          header='Node_Num')
 
 model.import_streams(gis_file='gis/Burdekin_v2_upperlower_Reach.shp',
                      header='Reach_Num')
 
 # lastly, connect and order the components
+model.connect_streams(tolerance=10.0)
 
 # -------------------------------------------------------------------
 # Set up the rainfall
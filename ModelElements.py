@@ -193,3 +193,5 @@ class Stream(StorageNode):
         super(Stream, self).__init__(name)
         self.type = 'stream'
         self.position = LineString()
+        self.upstream_node = None
+        self.downstream_node = None
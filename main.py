@@ -1,26 +1,27 @@
 from HydrologicModel import StorageNode
 from HydrologicModel import FloodEvent
 import pandas as pd
+import argparse
 
+# set up the inflows to be modelled
+standard_flows = {"inflow_file": 'config/120122A_Feb_2009.csv',
+                  "inflow_col_name": 'Flow',
+                  "scaling_factors": [1.0, 1.5, 2.0, 3.0],
+                  "result_file_prefix": 'Feb_2009'
+                  }
 
-def main():
-    # repeat the computations on this run?
-    do_computation = True
+pmf_flows = {"inflow_file": 'config/PMF_flow.csv',
+             "inflow_col_name": 'Flow_PMF',
+             "scaling_factors": [1.0],
+             "result_file_prefix": 'PMF'
+             }
 
-    # set up the inflows to be modelled
-    standard_flows = {"inflow_file": 'config/120122A_Feb_2009.csv',
-                      "inflow_col_name": 'Flow',
-                      "scaling_factors": [1.0, 1.5, 2.0, 3.0],
-                      "result_file_prefix": 'Feb_2009'
-                      }
+flows = [standard_flows, pmf_flows]
 
-    pmf_flows = {"inflow_file": 'config/PMF_flow.csv',
-                 "inflow_col_name": 'Flow_PMF',
-                 "scaling_factors": [1.0],
-                 "result_file_prefix": 'PMF'
-                 }
 
-    flows = [standard_flows, pmf_flows]
+def main():
+    # repeat the computations on this run?
+    do_computation = True
 
     all_simulations = FloodEvent()
     all_simulations.set_event_parameters('config/event_parameters.json')
@@ -64,17 +65,82 @@ def main():
     results.to_csv('results.csv')
 
 
+def sweep():
+    # keep only the peak and volume envelopes at each stream instead of writing every hydrograph
+    all_simulations = FloodEvent()
+    all_simulations.set_event_parameters('config/event_parameters.json')
+    all_simulations.import_streams()
+    simulations = all_simulations.simulations
+    streams = all_simulations.streams
+
+    # set up the members, largest inflow peak first so the envelope fills early and prunes the rest
+    members = []
+    for flow in flows:
+        inflow = all_simulations.inflow_csv(flow['inflow_file'], flow['inflow_col_name'])
+        for scaling_factor in flow['scaling_factors']:
+            scaling_factor_text = '{:.2f}'.format(scaling_factor).replace(".", "p")
+            for simulation in simulations:
+                members.append({'name': '{}_{}_SF{}'.format(flow['result_file_prefix'], simulation['name'],
+                                                            scaling_factor_text),
+                                'simulation': simulation,
+                                'scaling_factor': scaling_factor,
+                                'inflow': inflow,
+                                'inflow_peak': inflow['Inflow'].max() * scaling_factor})
+    members = sorted(members, key=lambda member: member['inflow_peak'], reverse=True)
+
+    envelope = {}
+    for stream in streams:
+        stream_envelope = {'Peak': 0.0, 'Time_of_peak': 0.0, 'Peak_member': '',
+                           'Volume': 0.0, 'Volume_member': '', 'Members_pruned': 0}
+        for member in members:
+            result = compute_peak_outflow(member['simulation'], stream, member['scaling_factor'],
+                                          member['inflow'], stream_envelope)
+            if result['Peak'] > stream_envelope['Peak']:
+                stream_envelope['Peak'] = result['Peak']
+                stream_envelope['Time_of_peak'] = result['Time_of_peak']
+                stream_envelope['Peak_member'] = member['name']
+            if result['Volume'] > stream_envelope['Volume']:
+                stream_envelope['Volume'] = result['Volume']
+                stream_envelope['Volume_member'] = member['name']
+            if not result['Completed']:
+                stream_envelope['Members_pruned'] += 1
+        print('Envelope for stream {}: {}'.format(stream['name'], stream_envelope))
+        envelope[stream['name']] = stream_envelope
+
+    # write the envelope of all simulations into a single csv file
+    results = pd.DataFrame.from_dict(envelope, orient='index')
+    results.index.name = 'Stream'
+    results.to_csv('envelope.csv')
+
+
+def compute_peak_outflow(simulation, stream_parameters, scaling_factor, inflow, stream_envelope):
+    stream = set_up_stream(simulation, stream_parameters, scaling_factor, inflow)
+    return stream.compute_peak_outflow(peak_to_beat=stream_envelope['Peak'],
+                                       volume_to_beat=stream_envelope['Volume'])
+
+
 def compute_outflows(simulation, stream_parameters, scaling_factor, result_file, inflow):
+    stream = set_up_stream(simulation, stream_parameters, scaling_factor, inflow)
+    stream.compute_outflow()
+    stream.write_to_csv(result_file)
+
+
+def set_up_stream(simulation, stream_parameters, scaling_factor, inflow):
     stream = StorageNode(stream_parameters['name'])
     stream.inflows = inflow
     stream.scale_inflow(scaling_factor)
     stream.set_routing_parameters(routing_method=str(simulation['routing_method']),
                                   parameters=simulation['parameters'],
                                   stream_length=stream_parameters['length'])
-    stream.compute_outflow()
-    stream.write_to_csv(result_file)
+    return stream
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Route the inflows through the streams')
+    parser.add_argument('--sweep', action='store_true',
+                        help='keep only the peak and volume envelopes of each stream (written to envelope.csv)')
+    if parser.parse_args().sweep:
+        sweep()
+    else:
+        main()
 